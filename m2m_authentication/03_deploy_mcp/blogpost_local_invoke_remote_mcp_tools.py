@@ -27,6 +27,7 @@ import base64
 import yaml
 import boto3
 import requests
+from botocore.config import Config
 import argparse
 from datetime import datetime, timedelta
 from mcp import ClientSession
@@ -39,23 +40,18 @@ def get_cognito_bearer_token(mcp_name):
     
     try:
         # Get stored parameters from SSM
-        ssm_client = boto3.client('ssm')
+        ssm_client = boto3.client('ssm', config=Config(retries={'mode': 'adaptive', 'max_attempts': 10}))
         
-        # Get Cognito domain URL
-        domain_url = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/cognito_domain'
-        )['Parameter']['Value']
-        
-        # Get Machine Client ID
-        client_id = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/machine_client_id'
-        )['Parameter']['Value']
-        
-        # Get Machine Client Secret
-        client_secret = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/cognito_secret',
+        # Get Cognito domain URL, Machine Client ID and Secret from the
+        # JSON configuration document written by setup_M2M_cognito.py
+        config = json.loads(ssm_client.get_parameter(
+            Name=f'/app/blogpost/mcp/{mcp_name}/config',
             WithDecryption=True
-        )['Parameter']['Value']
+        )['Parameter']['Value'])
+        
+        domain_url = config['domain_url']
+        client_id = config['machine_client_id']
+        client_secret = config['cognito_secret']
         
         print(f"Retrieved credentials from SSM")
         print(f"Using Cognito domain: {domain_url}")
@@ -7,11 +7,61 @@ No AgentCore OAuth2 credential provider needed for direct approach.
 
 import boto3
 import click
+import json
+import re
 import sys
-import random
-import string
+import secrets
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
+# Adaptive retries back off automatically when SSM or Cognito throttle requests
+AWS_CONFIG = Config(retries={'mode': 'adaptive', 'max_attempts': 10}, max_pool_connections=32)
+
+# AWS clients are created once and shared by setup and cleanup
+_COGNITO = boto3.client('cognito-idp', config=AWS_CONFIG)
+_SSM = boto3.client('ssm', config=AWS_CONFIG)
+
+# MCP server names may contain only letters, numbers, hyphens, and underscores
+_MCP_NAME_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+def get_config_parameter_name(mcp_name):
+    """SSM parameter holding the JSON-encoded Cognito configuration of an MCP server."""
+    return f'/app/blogpost/mcp/{mcp_name}/config'
+
+def load_stored_config(mcp_name):
+    """Load the Cognito configuration stored in SSM by a previous setup run."""
+    value = _SSM.get_parameter(
+        Name=get_config_parameter_name(mcp_name),
+        WithDecryption=True
+    )['Parameter']['Value']
+    return json.loads(value)
+
+# Separate parameters written by setup runs that predate the JSON configuration
+LEGACY_PARAMETER_KEYS = ('userpool_id', 'machine_client_id', 'cognito_secret', 'cognito_discovery_url', 'cognito_domain')
+
+def get_legacy_parameter_name(mcp_name, key):
+    """SSM parameter of the pre-JSON layout holding a single configuration value."""
+    return f'/app/blogpost/mcp/{mcp_name}/{key}'
+
+def load_stored_value(mcp_name, key, legacy_key):
+    """
+    Load one value recorded by a previous setup run, falling back to the
+    legacy per-value parameter when the JSON configuration does not exist.
+    Returns the stored configuration (None for the legacy layout) and the value.
+    """
+    try:
+        config = load_stored_config(mcp_name)
+        return config, config[key]
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ParameterNotFound':
+            raise
+    value = _SSM.get_parameter(
+        Name=get_legacy_parameter_name(mcp_name, legacy_key),
+        WithDecryption=True
+    )['Parameter']['Value']
+    return None, value
+
 def get_aws_region():
     """Get AWS region from session."""
     session = boto3.session.Session()
@@ -19,129 +69,145 @@ def get_aws_region():
 
 def generate_domain_name():
     """Generate a unique domain name for Cognito."""
-    # Use a random suffix to avoid conflicts
-    suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
-    return f"mcp-agent-{suffix}"
+    # Use a random suffix (8 lowercase hex characters) to avoid conflicts
+    return f"mcp-agent-{secrets.token_hex(4)}"
+
+def find_first(operation, result_key, match, **kwargs):
+    """Page through a Cognito list operation and return the first matching item, or None."""
+    for page in _COGNITO.get_paginator(operation).paginate(**kwargs):
+        for item in page[result_key]:
+            if match(item):
+                return item
+    return None
+
+def find_recorded_user_pool(mcp_name):
+    """Return the stored configuration and the User Pool it refers to, or (None, None) if either is gone."""
+    try:
+        config = load_stored_config(mcp_name)
+        pool_info = _COGNITO.describe_user_pool(UserPoolId=config['user_pool_id'])['UserPool']
+        return config, pool_info
+    except ClientError:
+        return None, None
 
 def create_cognito_user_pool(mcp_name):
     """Create Cognito User Pool with M2M client for direct MCP access."""
     print("Setting up Cognito User Pool for Direct MCP Access...")
     
-    cognito_client = boto3.client('cognito-idp')
     region = get_aws_region()
     
     try:
-        # Check if User Pool already exists
-        print("Checking for existing User Pool 'BlogpostMCPAgentPool'...")
-        existing_pools = cognito_client.list_user_pools(MaxResults=60)
-        user_pool_id = None
-        
-        for pool in existing_pools['UserPools']:
-            if pool['Name'] == 'BlogpostMCPAgentPool':
-                user_pool_id = pool['Id']
-                print(f"Found existing User Pool: {user_pool_id}")
-                break
+        # Skip the Cognito listings when SSM already records the resources of a previous run
+        expected_client_name = f'BlogpostMCPAgentMachineClient-{mcp_name}'
+        stored_config, pool_info = find_recorded_user_pool(mcp_name)
         
-        if not user_pool_id:
-            # Create User Pool
-            print("Creating new User Pool...")
-            user_pool_response = cognito_client.create_user_pool(
-                PoolName='BlogpostMCPAgentPool',
-                MfaConfiguration='OFF',
-                UsernameConfiguration={
-                    'CaseSensitive': False
-                },
-                UsernameAttributes=['email'],
-                AutoVerifiedAttributes=['email']
+        if stored_config:
+            user_pool_id = stored_config['user_pool_id']
+            machine_client_id = stored_config['machine_client_id']
+            machine_client_secret = stored_config['cognito_secret']
+            print(f"Found User Pool {user_pool_id} and Machine Client {machine_client_id} recorded in SSM")
+        else:
+            # Check if User Pool already exists
+            print("Checking for existing User Pool 'BlogpostMCPAgentPool'...")
+            existing_pool = find_first(
+                'list_user_pools', 'UserPools',
+                lambda pool: pool['Name'] == 'BlogpostMCPAgentPool',
+                PaginationConfig={'PageSize': 60}
             )
+        
+            if existing_pool:
+                user_pool_id = existing_pool['Id']
+                print(f"Found existing User Pool: {user_pool_id}")
+            else:
+                # Create User Pool
+                print("Creating new User Pool...")
+                user_pool_response = _COGNITO.create_user_pool(
+                    PoolName='BlogpostMCPAgentPool',
+                    MfaConfiguration='OFF',
+                    UsernameConfiguration={
+                        'CaseSensitive': False
+                    },
+                    UsernameAttributes=['email'],
+                    AutoVerifiedAttributes=['email']
+                )
             
-            user_pool_id = user_pool_response['UserPool']['Id']
-            print(f"Created User Pool: {user_pool_id}")
+                user_pool_id = user_pool_response['UserPool']['Id']
+                print(f"Created User Pool: {user_pool_id}")
         
-        # Check if Resource Server already exists
-        print("Checking for existing Resource Server...")
-        resource_server_exists = False
+            # Probe the Resource Server, Machine Client and Domain of the pool concurrently
+            print("Checking for existing Resource Server, Machine Client and Domain...")
+            probes = {}
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                futures = {
+                    executor.submit(
+                        find_first, 'list_resource_servers', 'ResourceServers',
+                        lambda server: server['Identifier'] == 'blogpost-m2m-resource-server',
+                        UserPoolId=user_pool_id, PaginationConfig={'PageSize': 50}
+                    ): 'resource_server',
+                    executor.submit(
+                        find_first, 'list_user_pool_clients', 'UserPoolClients',
+                        lambda client: client['ClientName'] == expected_client_name,
+                        UserPoolId=user_pool_id, PaginationConfig={'PageSize': 60}
+                    ): 'client',
+                    executor.submit(_COGNITO.describe_user_pool, UserPoolId=user_pool_id): 'pool'
+                }
+                for future in as_completed(futures):
+                    probe = futures[future]
+                    try:
+                        probes[probe] = future.result()
+                    except ClientError:
+                        if probe != 'resource_server':
+                            raise
+                        # If we can't list resource servers, assume none exist
+                        probes[probe] = None
         
-        try:
-            existing_servers = cognito_client.list_resource_servers(
-                UserPoolId=user_pool_id,
-                MaxResults=50
-            )
+            if probes['resource_server']:
+                print(f"Found existing Resource Server: {probes['resource_server']['Identifier']}")
+            else:
+                # Create Resource Server (required for M2M client)
+                print("Creating new Resource Server...")
+                resource_server_response = _COGNITO.create_resource_server(
+                    UserPoolId=user_pool_id,
+                    Identifier='blogpost-m2m-resource-server',
+                    Name='Blogpost M2M Resource Server',
+                    Scopes=[
+                        {
+                            'ScopeName': 'read',
+                            'ScopeDescription': 'An example scope created by Amazon Cognito quick start'
+                        }
+                    ]
+                )
             
-            for server in existing_servers['ResourceServers']:
-                if server['Identifier'] == 'blogpost-m2m-resource-server':
-                    resource_server_exists = True
-                    print(f"Found existing Resource Server: {server['Identifier']}")
-                    break
-        except ClientError as e:
-            # If we can't list resource servers, assume none exist
-            pass
+                print("Created Resource Server")
         
-        if not resource_server_exists:
-            # Create Resource Server (required for M2M client)
-            print("Creating new Resource Server...")
-            resource_server_response = cognito_client.create_resource_server(
-                UserPoolId=user_pool_id,
-                Identifier='blogpost-m2m-resource-server',
-                Name='Blogpost M2M Resource Server',
-                Scopes=[
-                    {
-                        'ScopeName': 'read',
-                        'ScopeDescription': 'An example scope created by Amazon Cognito quick start'
-                    }
-                ]
-            )
-            
-            print("Created Resource Server")
+            # Check if Machine Client already exists for this MCP server
+            machine_client_id = None
+            machine_client_secret = None
+        
+            if probes['client']:
+                machine_client_id = probes['client']['ClientId']
+                print(f"Found existing Machine Client: {machine_client_id}")
+        
+            pool_info = probes['pool']['UserPool']
         
         # Handle Cognito Domain - one domain per User Pool (shared across all MCP servers)
         print("Setting up Cognito Domain...")
-        domain_name = None
+        domain_name = pool_info.get('Domain')
         
-        try:
-            # Try to create a domain - each User Pool can only have one domain
-            temp_domain_name = generate_domain_name()
-            cognito_client.create_user_pool_domain(
-                Domain=temp_domain_name,
+        if domain_name:
+            # All MCP servers share the domain already configured on the User Pool
+            print(f"Using existing shared domain: {domain_name}")
+        else:
+            domain_name = generate_domain_name()
+            _COGNITO.create_user_pool_domain(
+                Domain=domain_name,
                 UserPoolId=user_pool_id
             )
-            domain_name = temp_domain_name
             print(f"Created Cognito Domain: {domain_name}")
-            
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'InvalidParameterException' and 'already has a domain configured' in str(e):
-                # Domain already exists for this User Pool - that's fine!
-                # All MCP servers will share the same domain
-                print("User Pool already has a domain configured (shared across all MCP servers)")
-                # Use a predictable pattern based on user pool ID
-                pool_suffix = user_pool_id.split('_')[1].lower()
-                domain_name = f"mcp-agent-{pool_suffix}"
-                print(f"Using existing shared domain: {domain_name}")
-            else:
-                raise e
-        
-        # Check if Machine Client already exists for this MCP server
-        print("Checking for existing Machine Client...")
-        existing_clients = cognito_client.list_user_pool_clients(
-            UserPoolId=user_pool_id,
-            MaxResults=60
-        )
-        
-        machine_client_id = None
-        machine_client_secret = None
-        
-        # Look for existing client with the same name pattern
-        expected_client_name = f'BlogpostMCPAgentMachineClient-{mcp_name}'
-        for client in existing_clients['UserPoolClients']:
-            if client['ClientName'] == expected_client_name:
-                machine_client_id = client['ClientId']
-                print(f"Found existing Machine Client: {machine_client_id}")
-                break
         
         if not machine_client_id:
             # Create new Machine-to-Machine App Client
             print(f"Creating new Machine Client: {expected_client_name}")
-            machine_client_response = cognito_client.create_user_pool_client(
+            machine_client_response = _COGNITO.create_user_pool_client(
                 UserPoolId=user_pool_id,
                 ClientName=expected_client_name,
                 GenerateSecret=True,
@@ -165,72 +231,42 @@ def create_cognito_user_pool(mcp_name):
             machine_client_secret = machine_client_response['UserPoolClient']['ClientSecret']
             
             print(f"Created Machine Client: {machine_client_id}")
-        else:
+        elif machine_client_secret is None:
             # For existing client, we need to get the secret from SSM or regenerate it
             print("Using existing Machine Client - checking SSM for secret...")
             try:
-                ssm_client = boto3.client('ssm')
-                machine_client_secret = ssm_client.get_parameter(
-                    Name=f'/app/mcp/{mcp_name}/cognito_secret',
-                    WithDecryption=True
-                )['Parameter']['Value']
+                stored_config, machine_client_secret = load_stored_value(mcp_name, 'cognito_secret', 'cognito_secret')
                 print("Retrieved existing secret from SSM")
             except Exception as e:
                 print(f"Could not retrieve secret from SSM: {e}")
                 print("You may need to regenerate the client secret manually")
                 machine_client_secret = "EXISTING_SECRET_NOT_AVAILABLE"
         
-        # Store ALL the parameters needed for direct MCP access
-        ssm_client = boto3.client('ssm')
-        
-        # Store User Pool ID
-        ssm_client.put_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/userpool_id',
-            Value=user_pool_id,
-            Type='String',
-            Overwrite=True,
-            Description=f'Cognito User Pool ID for {mcp_name} MCP server (blogpost)'
-        )
-        
-        # Store Machine Client ID
-        ssm_client.put_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/machine_client_id',
-            Value=machine_client_id,
-            Type='String',
-            Overwrite=True,
-            Description=f'Cognito Machine Client ID for {mcp_name} MCP server (blogpost)'
-        )
-        
-        # Store Machine Client Secret
-        ssm_client.put_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/cognito_secret',
-            Value=machine_client_secret,
-            Type='SecureString',
-            Overwrite=True,
-            Description=f'Cognito Machine Client Secret for {mcp_name} MCP server (blogpost)'
-        )
-        
-        # Store Discovery URL (for OAuth2 discovery)
+        # Store ALL the parameters needed for direct MCP access as one encrypted JSON document
         discovery_url = f'https://cognito-idp.{region}.amazonaws.com/{user_pool_id}/.well-known/openid-configuration'
-        ssm_client.put_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/cognito_discovery_url',
-            Value=discovery_url,
-            Type='String',
-            Overwrite=True,
-            Description=f'Cognito Discovery URL for {mcp_name} MCP server (blogpost)'
-        )
-        
-        # Store Cognito Domain (CRITICAL for OAuth2 to work)
+        # Cognito Domain is CRITICAL for OAuth2 to work
         domain_url = f'https://{domain_name}.auth.{region}.amazoncognito.com'
-        ssm_client.put_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/cognito_domain',
-            Value=domain_url,
-            Type='String',
-            Overwrite=True,
-            Description=f'Cognito Domain URL for {mcp_name} OAuth2 token endpoint (blogpost)'
-        )
         
-        print("Stored required parameters in SSM")
+        config = {
+            'user_pool_id': user_pool_id,
+            'machine_client_id': machine_client_id,
+            'cognito_secret': machine_client_secret,
+            'discovery_url': discovery_url,
+            'domain_url': domain_url
+        }
+        # Skip the write (and its KMS encryption) when a previous run already stored the same values
+        if config == stored_config:
+            print("SSM parameters already up to date")
+        else:
+            _SSM.put_parameter(
+                Name=get_config_parameter_name(mcp_name),
+                Value=json.dumps(config),
+                Type='SecureString',
+                Overwrite=True,
+                Description=f'Cognito configuration for {mcp_name} MCP server (blogpost)'
+            )
+            
+            print("Stored required parameters in SSM")
         
         return {
             'user_pool_id': user_pool_id,
@@ -246,63 +282,56 @@ def create_cognito_user_pool(mcp_name):
         return None
 
 def delete_cognito_resources(mcp_name):
-    """Delete Cognito User Pool and related resources."""
+    """Delete Cognito User Pool and related resources. Safe to re-run after a partial cleanup."""
     print(f"Cleaning up Cognito resources for MCP server: {mcp_name}...")
     
     try:
         # Get User Pool ID from SSM
-        ssm_client = boto3.client('ssm')
-        user_pool_id = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/userpool_id'
-        )['Parameter']['Value']
+        try:
+            _, user_pool_id = load_stored_value(mcp_name, 'user_pool_id', 'userpool_id')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ParameterNotFound':
+                raise
+            print("No Cognito configuration found in SSM - nothing to clean up")
+            return True
         
         print(f"Found User Pool: {user_pool_id}")
         
-        # Delete Cognito Domain first (if it exists)
-        cognito_client = boto3.client('cognito-idp')
         try:
-            # Try to delete the domain - we'll use the pattern-based approach
-            pool_suffix = user_pool_id.split('_')[1].lower()
-            likely_domain_name = f"mcp-agent-{pool_suffix}"
+            # Delete Cognito Domain first (if it exists)
+            domain_name = _COGNITO.describe_user_pool(UserPoolId=user_pool_id)['UserPool'].get('Domain')
+            if domain_name:
+                try:
+                    _COGNITO.delete_user_pool_domain(
+                        Domain=domain_name,
+                        UserPoolId=user_pool_id
+                    )
+                    print(f"Deleted Cognito Domain: {domain_name}")
+                except ClientError as e:
+                    print(f"Could not delete domain: {e}")
+            else:
+                print("No Cognito Domain configured (may have been deleted already)")
             
-            try:
-                cognito_client.delete_user_pool_domain(
-                    Domain=likely_domain_name,
-                    UserPoolId=user_pool_id
-                )
-                print(f"Deleted Cognito Domain: {likely_domain_name}")
-            except ClientError as domain_e:
-                if domain_e.response['Error']['Code'] == 'ResourceNotFoundException':
-                    print(f"Domain {likely_domain_name} not found (may have been deleted already)")
-                else:
-                    print(f"Could not delete domain {likely_domain_name}: {domain_e}")
-                    
-        except Exception as e:
-            print(f"Could not delete domain: {e}")
-        
-        # Delete User Pool (this will cascade delete all related resources)
-        cognito_client.delete_user_pool(UserPoolId=user_pool_id)
-        
-        print(f"Deleted User Pool: {user_pool_id}")
+            # Delete User Pool (this will cascade delete all related resources)
+            _COGNITO.delete_user_pool(UserPoolId=user_pool_id)
+            
+            print(f"Deleted User Pool: {user_pool_id}")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            print(f"User Pool {user_pool_id} not found (may have been deleted already)")
         
-        # Delete SSM parameters
-        ssm_parameters = [
-            f'/app/blogpost/mcp/{mcp_name}/userpool_id',
-            f'/app/blogpost/mcp/{mcp_name}/machine_client_id',
-            f'/app/blogpost/mcp/{mcp_name}/cognito_secret',
-            f'/app/blogpost/mcp/{mcp_name}/cognito_discovery_url',
-            f'/app/blogpost/mcp/{mcp_name}/cognito_domain'
+        # Delete SSM parameters only after the User Pool is gone, since they record its ID.
+        # The legacy per-value parameters are included so older deployments are cleaned up too;
+        # DeleteParameters reports missing names instead of raising.
+        param_names = [get_config_parameter_name(mcp_name)] + [
+            get_legacy_parameter_name(mcp_name, key) for key in LEGACY_PARAMETER_KEYS
         ]
-        
-        for param_name in ssm_parameters:
-            try:
-                ssm_client.delete_parameter(Name=param_name)
-                print(f"Deleted SSM parameter: {param_name}")
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'ParameterNotFound':
-                    print(f"SSM parameter not found: {param_name}")
-                else:
-                    print(f"Failed to delete SSM parameter {param_name}: {e}")
+        response = _SSM.delete_parameters(Names=param_names)
+        for param_name in response['DeletedParameters']:
+            print(f"Deleted SSM parameter: {param_name}")
+        for param_name in response['InvalidParameters']:
+            print(f"SSM parameter not found: {param_name}")
         
         print("Cognito resources cleanup complete")
         return True
@@ -329,7 +358,7 @@ def setup(mcp_name):
     print("=" * 60)
     
     # Validate MCP server name
-    if not mcp_name.replace('_', '').replace('-', '').isalnum():
+    if not _MCP_NAME_RE.fullmatch(mcp_name):
         print("MCP server name must contain only letters, numbers, hyphens, and underscores")
         sys.exit(1)
     
@@ -1,38 +1,137 @@
 from strands import Agent
 import os
+import asyncio
+import re
+import json
+import functools
+import time
+import base64
+import threading
 import boto3
+import httpx
 import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 from strands.models import BedrockModel
 from strands.tools.mcp import MCPClient
 from mcp.client.streamable_http import streamablehttp_client
-from datetime import timedelta
+from urllib.parse import quote
 from typing import List, Optional
 import traceback
 import logging
 
+# orjson parses the bytes directly and is notably faster; fall back to the stdlib
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# MCP server endpoint - UPDATE THE ARN WITH YOUR ACTUAL ARN FROM .bedrock_agentcore.yaml
+# Find the ARN in your .bedrock_agentcore.yaml file after running 'agentcore launch'
+MCP_SERVER_ARN = "arn:aws:bedrock-agentcore:eu-central-1:ACCOUNTID:runtime/blogpost_mcp_simple_calculator-DEPLOYMENTID"
+REGION = "eu-central-1"
+ENCODED_ARN = quote(MCP_SERVER_ARN, safe="")
+MCP_URL = f"https://bedrock-agentcore.{REGION}.amazonaws.com/runtimes/{ENCODED_ARN}/invocations?qualifier=DEFAULT"
+
+# Pooled HTTP session for the OAuth2 discovery and token endpoints
+HTTP_TIMEOUT = (5, 30)  # (connect, read) seconds
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# MCP transport timeouts: connect fast, but allow long-running tool calls
+MCP_HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0)
+
+# In-memory caches: SSM values by (name, decrypt), bearer tokens by client_id
+SSM_CACHE_TTL = 300  # seconds
+TOKEN_REFRESH_WINDOW = 60  # refresh tokens this many seconds before they expire
+TOKEN_REFRESH_RETRY_DELAY = 10  # seconds between background refresh attempts after a failure
+_SSM_CACHE = {}
+_SSM_CACHE_LOCK = threading.Lock()
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+# OIDC discovery documents by URL, honouring Cache-Control max-age
+DISCOVERY_CACHE_TTL = 24 * 60 * 60  # seconds, used when the response sets no max-age
+_DISCOVERY_CACHE = {}
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+@functools.lru_cache(maxsize=None)
+def get_aws_client(service_name: str):
+    """
+    Create an AWS client on first use and share it across calls.
+    """
+    # Adaptive retries back off automatically when SSM or Cognito throttle requests
+    config = Config(retries={'mode': 'adaptive', 'max_attempts': 10}, max_pool_connections=32)
+    return boto3.client(service_name, region_name=REGION, config=config)
+
+
+@functools.lru_cache(maxsize=32)
+def decode_jwt_claims(token: str) -> tuple:
+    """
+    Decode the JWT payload and return its (exp, iat) claims, memoized per token.
+    """
+    parts = token.split('.')
+    if len(parts) != 3:
+        raise ValueError("Invalid JWT format")
+    payload = parts[1] + '=' * (-len(parts[1]) % 4)
+    payload_json = json_loads(base64.urlsafe_b64decode(payload))
+    return payload_json.get('exp', 0), payload_json.get('iat', 0)
+
 
 def get_bearer_token(discovery_url: str, client_id: str, client_secret: str) -> str:
     """
     Get OAuth2 bearer token using OAuth2 discovery flow.
     This follows the working example pattern for proper token acquisition.
     """
+    with _TOKEN_CACHE_LOCK:
+        # Reuse a cached token until it is about to expire
+        cached = _TOKEN_CACHE.get(client_id)
+        if cached and cached[1] - time.time() > TOKEN_REFRESH_WINDOW:
+            logger.info("Reusing cached access token")
+            return cached[0]
+        access_token = _request_bearer_token(discovery_url, client_id, client_secret)
+        try:
+            exp, _ = decode_jwt_claims(access_token)
+            _TOKEN_CACHE[client_id] = (access_token, exp)
+        except Exception as e:
+            logger.warning("Could not decode access token, not caching it: %s", e)
+        return access_token
+
+def get_discovery_document(discovery_url: str) -> dict:
+    """
+    Fetch the OAuth2 discovery document, reusing a cached copy until it expires.
+    """
+    cached = _DISCOVERY_CACHE.get(discovery_url)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    
+    logger.info("Fetching OAuth2 discovery data from: %s", discovery_url)
+    response = _HTTP.get(discovery_url, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch discovery data: {response.status_code}")
+    
+    discovery_data = response.json()
+    max_age = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+    ttl = int(max_age.group(1)) if max_age else DISCOVERY_CACHE_TTL
+    _DISCOVERY_CACHE[discovery_url] = (time.monotonic() + ttl, discovery_data)
+    return discovery_data
+
+def _request_bearer_token(discovery_url: str, client_id: str, client_secret: str) -> str:
+    """
+    Request a new access token from the token endpoint advertised by the discovery document.
+    """
     try:
-        logger.info(f"Fetching OAuth2 discovery data from: {discovery_url}")
-        
         # Get discovery data to find token endpoint
-        response = requests.get(discovery_url)
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch discovery data: {response.status_code}")
-            
-        discovery_data = response.json()
+        discovery_data = get_discovery_document(discovery_url)
         token_endpoint = discovery_data['token_endpoint']
         
-        logger.info(f"Using token endpoint: {token_endpoint}")
+        logger.info("Using token endpoint: %s", token_endpoint)
         
         # Client credentials flow
         data = {
@@ -46,9 +145,9 @@ def get_bearer_token(discovery_url: str, client_id: str, client_secret: str) ->
         }
         
         logger.info("Requesting access token...")
-        response = requests.post(token_endpoint, data=data, headers=headers)
+        response = _HTTP.post(token_endpoint, data=data, headers=headers, timeout=HTTP_TIMEOUT)
         
-        logger.info(f"Response status: {response.status_code}")
+        logger.info("Response status: %s", response.status_code)
         
         if response.status_code == 200:
             token_data = response.json()
@@ -56,19 +155,19 @@ def get_bearer_token(discovery_url: str, client_id: str, client_secret: str) ->
                 logger.info("Access token obtained successfully")
                 return token_data['access_token']
             else:
-                logger.error(f"No access_token in response: {token_data}")
+                logger.error("No access_token in response: %s", token_data)
                 raise Exception(f"No access token in response: {token_data}")
         else:
             try:
                 error_data = response.json()
-                logger.error(f"Token request failed: {error_data}")
+                logger.error("Token request failed: %s", error_data)
             except:
-                logger.error(f"Token request failed: {response.text}")
+                logger.error("Token request failed: %s", response.text)
                 
             raise Exception(f"Token request failed with status {response.status_code}")
             
     except Exception as e:
-        logger.error(f"Error getting bearer token: {str(e)}")
+        logger.error("Error getting bearer token: %s", e)
         raise
 
 def get_ssm_parameter(parameter_name: str, decrypt: bool = True) -> str:
@@ -77,20 +176,141 @@ def get_ssm_parameter(parameter_name: str, decrypt: bool = True) -> str:
     This follows the Single Responsibility Principle by handling only parameter retrieval.
     """
     try:
-        ssm_client = boto3.client('ssm')
-        response = ssm_client.get_parameter(
-            Name=parameter_name,
-            WithDecryption=decrypt
-        )
-        logger.info(f"SSM parameter {parameter_name} retrieved successfully")
-        return response['Parameter']['Value']
+        key = (parameter_name, decrypt)
+        with _SSM_CACHE_LOCK:
+            cached = _SSM_CACHE.get(key)
+            if cached and time.monotonic() - cached[0] < SSM_CACHE_TTL:
+                return cached[1]
+            response = get_aws_client('ssm').get_parameter(
+                Name=parameter_name,
+                WithDecryption=decrypt
+            )
+            value = response['Parameter']['Value']
+            _SSM_CACHE[key] = (time.monotonic(), value)
+        logger.info("SSM parameter %s retrieved successfully", parameter_name)
+        return value
     except Exception as e:
-        logger.error(f"Failed to retrieve SSM parameter {parameter_name}: {str(e)}")
+        logger.error("Failed to retrieve SSM parameter %s: %s", parameter_name, e)
         raise ValueError(f"Failed to retrieve SSM parameter {parameter_name}: {str(e)}")
 
+def clear_ssm_cache() -> None:
+    """
+    Drop all cached SSM values, e.g. between tests or after rotating a secret.
+    """
+    with _SSM_CACHE_LOCK:
+        _SSM_CACHE.clear()
+
+# Mirror the functools.lru_cache API on the cached getter
+get_ssm_parameter.cache_clear = clear_ssm_cache
+
+class BearerTokenAuth(httpx.Auth):
+    """
+    httpx auth hook that stamps the current bearer token onto every MCP request.
+    Swapping the token updates the live session without reconnecting.
+    """
+    def __init__(self, token: str):
+        self.token = token
+
+    def auth_flow(self, request):
+        request.headers["authorization"] = f"Bearer {self.token}"
+        yield request
+
+def create_http_client(headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+    """
+    httpx client factory for the MCP transport: fail fast on connect, allow slow tool calls.
+    """
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=MCP_HTTP_TIMEOUT,
+        auth=auth,
+        follow_redirects=True
+    )
+
+def get_oauth_config() -> tuple:
+    """
+    Retrieve the OAuth2 client_id, client_secret and discovery_url from the
+    JSON configuration document that setup_M2M_cognito.py stores in SSM.
+    """
+    config = json_loads(get_ssm_parameter("/app/blogpost/mcp/blogpost_mcp_simple_calculator/config"))
+    return config['machine_client_id'], config['cognito_secret'], config['discovery_url']
+
+async def refresh_token(auth: BearerTokenAuth):
+    """
+    Fetch a new bearer token without blocking the event loop and hand it to the auth hook.
+    """
+    client_id, client_secret, discovery_url = await asyncio.to_thread(get_oauth_config)
+    auth.token = await asyncio.to_thread(get_bearer_token, discovery_url, client_id, client_secret)
+    logger.info("Refreshed MCP bearer token")
+
+async def ensure_fresh_token(auth: BearerTokenAuth):
+    """
+    Refresh the bearer token now if it expires within TOKEN_REFRESH_WINDOW.
+    The background loop can't run while a synchronous agent call holds the event loop,
+    so this covers requests that arrive after a long idle period.
+    """
+    try:
+        exp, _ = decode_jwt_claims(auth.token)
+    except Exception:
+        exp = 0
+    if exp - time.time() <= TOKEN_REFRESH_WINDOW:
+        await refresh_token(auth)
+
+async def token_refresh_loop(auth: BearerTokenAuth):
+    """
+    Refresh the MCP bearer token shortly before it expires, off the request path.
+    """
+    while True:
+        try:
+            exp, _ = decode_jwt_claims(auth.token)
+        except Exception as e:
+            logger.error("Cannot schedule token refresh, token not decodable: %s", e)
+            return
+        await asyncio.sleep(max(exp - time.time() - TOKEN_REFRESH_WINDOW, 0))
+        try:
+            await refresh_token(auth)
+        except Exception as e:
+            logger.error("Token refresh failed, retrying: %s", e)
+            await asyncio.sleep(TOKEN_REFRESH_RETRY_DELAY)
+
+SYSTEM_PROMPT_TEMPLATE = """You are an intelligent assistant with direct access to MCP (Model Context Protocol) tools.
+
+You have access to the following MCP tools:
+{tools}
+
+Use these tools when appropriate to help users. Always be helpful and accurate in your responses."""
+
+def load_mcp_tools(client) -> tuple:
+    """
+    List the MCP server's tools and render the system prompt listing them.
+    Set MCP_TOOL_ALLOWLIST to a comma-separated list of tool names to expose only those.
+    """
+    all_tools = client.list_tools_sync()
+    logger.info("Retrieved %s tools from MCP server", len(all_tools))
+    
+    allowlist = os.environ.get("MCP_TOOL_ALLOWLIST")
+    if allowlist:
+        allowed = {name.strip() for name in allowlist.split(",") if name.strip()}
+        all_tools = [tool for tool in all_tools if tool.tool_name in allowed]
+        logger.info("Using %s tools allowed by MCP_TOOL_ALLOWLIST", len(all_tools))
+    
+    # Render each tool's line once; it is both logged and listed in the system prompt
+    tool_lines = [
+        f"- {tool.tool_name}: {tool.tool_spec.get('description') or 'No description available'}"
+        for tool in all_tools
+    ]
+    if logger.isEnabledFor(logging.INFO):
+        for line in tool_lines:
+            logger.info("   %s", line)
+    
+    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(tools="\n".join(tool_lines))
+    
+    return all_tools, system_prompt
+
 app = BedrockAgentCoreApp()
 agent = None
 mcp_client = None
+mcp_auth = None
+token_refresh_task = None
 
 def create_agent() -> Agent:
     """
@@ -98,36 +318,28 @@ def create_agent() -> Agent:
     Following the working example pattern for MCP client connection.
     """
     try:
-        global mcp_client
+        global mcp_client, mcp_auth
         # Get OAuth2 configuration from SSM
         logger.info("Retrieving OAuth2 configuration...")
-        client_id = get_ssm_parameter("/app/blogpost/mcp/blogpost_mcp_simple_calculator/machine_client_id")
-        client_secret = get_ssm_parameter("/app/blogpost/mcp/blogpost_mcp_simple_calculator/cognito_secret")
-        discovery_url = get_ssm_parameter("/app/blogpost/mcp/blogpost_mcp_simple_calculator/cognito_discovery_url")
-        
-        # Get MCP server URL - UPDATE THIS WITH YOUR ACTUAL ARN FROM .bedrock_agentcore.yaml
-        # Find the ARN in your .bedrock_agentcore.yaml file after running 'agentcore launch'
-        mcp_server_arn = "arn:aws:bedrock-agentcore:eu-central-1:ACCOUNTID:runtime/blogpost_mcp_simple_calculator-DEPLOYMENTID"
-        region = "eu-central-1"
-        encoded_arn = mcp_server_arn.replace(":", "%3A").replace("/", "%2F")
-        mcp_url = f"https://bedrock-agentcore.{region}.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
+        client_id, client_secret, discovery_url = get_oauth_config()
         
-        logger.info(f"MCP Server URL: {mcp_url}")
-        logger.info(f"Discovery URL: {discovery_url}")
+        logger.info("MCP Server URL: %s", MCP_URL)
+        logger.info("Discovery URL: %s", discovery_url)
         
         # Get bearer token using OAuth2 discovery flow (like the working example)
         bearer_token = get_bearer_token(discovery_url, client_id, client_secret)
         
         # Create the MCP client following the working example pattern
-        mcp_client = MCPClient(lambda: streamablehttp_client(mcp_url, {
-            "authorization": f"Bearer {bearer_token}",
+        # The auth hook lets token_refresh_loop swap in fresh tokens later
+        mcp_auth = BearerTokenAuth(bearer_token)
+        mcp_client = MCPClient(lambda: streamablehttp_client(MCP_URL, {
             "Content-Type": "application/json"
-        }))
+        }, auth=mcp_auth, httpx_client_factory=create_http_client))
         
         # Initialize the model
         model_id = "eu.anthropic.claude-3-7-sonnet-20250219-v1:0"
         model = BedrockModel(model_id=model_id)
-        logger.info(f"Using model: {model_id}")
+        logger.info("Using model: %s", model_id)
         
         logger.info("Connecting to MCP server to retrieve tools...")
         
@@ -136,34 +348,30 @@ def create_agent() -> Agent:
         logger.info("Started persistent MCP client session")
         
         # Get tools without context manager (client stays alive)
-        all_tools = mcp_client.list_tools_sync()
-        logger.info(f"Retrieved {len(all_tools)} tools from MCP server")
-        
-        for tool in all_tools:
-            # Get tool description from tool_spec dictionary
-            tool_desc = tool.tool_spec.get('description', 'No description available')
-            logger.info(f"   - {tool.tool_name}: {tool_desc}")
+        all_tools, system_prompt = load_mcp_tools(mcp_client)
         
         # Create agent with tools (MCP client remains active)
         agent = Agent(
             model=model,
             tools=all_tools,
-            system_prompt=f"""You are an intelligent assistant with direct access to MCP (Model Context Protocol) tools.
-
-You have access to the following MCP tools:
-{chr(10).join([f"- {tool.tool_name}: {tool.tool_spec.get('description', 'No description available')}" for tool in all_tools])}
-
-Use these tools when appropriate to help users. Always be helpful and accurate in your responses."""
+            system_prompt=system_prompt
         )
         
         logger.info("Agent created successfully with persistent MCP session!")
         return agent
             
     except Exception as e:
-        logger.error(f"Failed to create agent: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Failed to create agent: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         raise
 
+# Create the agent when the container starts so the first request doesn't pay for it.
+# If bootstrap fails the import still succeeds and the first request retries it.
+try:
+    agent = create_agent()
+except Exception as e:
+    logger.error("Agent initialization deferred to the first request: %s", e)
+
 @app.entrypoint
 async def single_agent_mcp_bedrock(payload):
     """
@@ -171,45 +379,56 @@ async def single_agent_mcp_bedrock(payload):
     This follows the Single Responsibility Principle by handling only payload processing.
     """
     try:
-        global agent
+        global agent, token_refresh_task
 
         # Handle both "prompt" and "input" fields for compatibility
         user_input = payload.get("input") or payload.get("prompt")
         if not user_input:
             return "Error: No input provided in payload"
             
-        logger.info(f"User input: {user_input}")
+        logger.info("User input: %s", user_input)
         
-        # Create agent only once (persistent session)
+        # The agent is normally created at import; retry here only if that failed
         if agent is None:
             logger.info("Initializing agent with persistent MCP session...")
             try:
-                agent = create_agent()
+                # Build the agent in a worker thread so the blocking SSM/Cognito/MCP calls don't stall the event loop
+                agent = await asyncio.to_thread(create_agent)
                 logger.info("Agent initialization completed")
             except Exception as e:
                 error_msg = f"Failed to create agent: {str(e)}"
                 logger.error(error_msg)
                 return error_msg
-        else:
-            logger.info("Using existing agent with persistent MCP session")
+        
+        # The refresh loop needs the runtime's event loop, so it starts with the first request
+        if token_refresh_task is None:
+            token_refresh_task = asyncio.create_task(token_refresh_loop(mcp_auth))
+        
+        # The refresh loop only gets the event loop between requests; renew an expiring token here
+        try:
+            await ensure_fresh_token(mcp_auth)
+        except Exception as e:
+            error_msg = f"Failed to refresh bearer token: {str(e)}"
+            logger.error(error_msg)
+            return error_msg
 
         # Run the agent (MCP client already started and persistent)
         logger.info("Running agent...")
         try:
             response = agent(user_input)
             result = response.message['content'][0]['text']
-            logger.info(f"Agent response: {result}")
+            logger.info("Agent response: %s", result)
             return result
         except Exception as e:
             error_msg = f"Agent execution failed: {str(e)}"
             logger.error(error_msg)
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Traceback: %s", traceback.format_exc())
             return error_msg
             
     except Exception as e:
         error_msg = f"Entrypoint failed: {str(e)}"
         logger.error(error_msg)
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Traceback: %s", traceback.format_exc())
         return error_msg
 
 if __name__ == "__main__":
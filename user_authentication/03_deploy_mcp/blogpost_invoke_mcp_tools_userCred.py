@@ -23,97 +23,215 @@ import asyncio
 import os
 import sys
 import json
+import functools
+import time
 import base64
-import yaml
-import boto3
-import requests
+import threading
 import argparse
-from datetime import datetime, timedelta
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+from datetime import datetime
+from urllib.parse import quote
+
+# orjson parses the bytes directly and is notably faster; fall back to the stdlib
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# Heavy dependencies (boto3, yaml, mcp) are imported where they are first
+# needed so that --help and argument errors return immediately.
+
+# AgentCore deployment config and the JSON cache of the values derived from it
+AGENTCORE_CONFIG = ".bedrock_agentcore.yaml"
+AGENTCORE_CONFIG_CACHE = ".bedrock_agentcore.cache.json"
+
+# Bearer tokens persisted between runs, keyed by MCP server name
+TOKEN_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "agentcore-mcp", "token.json")
+
+# In-memory caches: SSM values by parameter name, bearer tokens by (client_id, username)
+SSM_CACHE_TTL = 300  # seconds
+TOKEN_REFRESH_WINDOW = 60  # refresh tokens this many seconds before they expire
+_SSM_CACHE = {}
+_SSM_CACHE_LOCK = threading.Lock()
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+
+def create_http_client(headers=None, timeout=None, auth=None):
+    """httpx client factory for the MCP transport: fail fast on connect, allow slow tool calls"""
+    import httpx
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0),
+        auth=auth,
+        follow_redirects=True
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_aws_client(service_name):
+    """Create an AWS client on first use and share it across calls"""
+    import boto3
+    from botocore.config import Config
+    # Adaptive retries back off automatically when SSM or Cognito throttle requests
+    config = Config(retries={'mode': 'adaptive', 'max_attempts': 10}, max_pool_connections=32)
+    return boto3.client(service_name, region_name='eu-central-1', config=config)
+
+
+def get_ssm_parameters(names):
+    """Get SSM parameter values by name, serving entries younger than SSM_CACHE_TTL from memory"""
+    with _SSM_CACHE_LOCK:
+        now = time.monotonic()
+        missing = [
+            name for name in names
+            if name not in _SSM_CACHE or now - _SSM_CACHE[name][0] >= SSM_CACHE_TTL
+        ]
+        if missing:
+            response = get_aws_client('ssm').get_parameters(Names=missing, WithDecryption=True)
+            if response['InvalidParameters']:
+                raise ValueError(f"Missing SSM parameters: {response['InvalidParameters']}")
+            for p in response['Parameters']:
+                _SSM_CACHE[p['Name']] = (now, p['Value'])
+        return {name: _SSM_CACHE[name][1] for name in names}
 
 
 def get_cognito_bearer_token(mcp_name):
     """Get Bearer token from Cognito using user credentials stored in SSM"""
+    from botocore.exceptions import ClientError
+    
     print("Getting Bearer token from Cognito using user credentials...")
     
     try:
-        # Get stored parameters from SSM
-        ssm_client = boto3.client('ssm')
-        
-        # Get Client ID (user pool client, not machine client)
-        client_id = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/machine_client_id'
-        )['Parameter']['Value']
-        
-        # Get username and password
-        username = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/username'
-        )['Parameter']['Value']
+        # Fetch Client ID (user pool client, not machine client), username
+        # and password in a single round trip
+        client_id_name = f'/app/blogpost/mcp/{mcp_name}/machine_client_id'
+        username_name = f'/app/blogpost/mcp/{mcp_name}/username'
+        password_name = f'/app/blogpost/mcp/{mcp_name}/password'
+        params = get_ssm_parameters([client_id_name, username_name, password_name])
         
-        password = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/password',
-            WithDecryption=True
-        )['Parameter']['Value']
+        client_id = params[client_id_name]
+        username = params[username_name]
+        password = params[password_name]
         
         print(f"Retrieved user credentials from SSM")
         print(f"Using username: {username}")
         
-        # Use AWS CLI to authenticate user and get bearer token
-        # This uses the USER_PASSWORD_AUTH flow (user-based authentication)
-        import subprocess
-        
-        # Prepare the AWS CLI command for user authentication
-        cmd = [
-            'aws', 'cognito-idp', 'initiate-auth',
-            '--client-id', client_id,
-            '--auth-flow', 'USER_PASSWORD_AUTH',
-            '--auth-parameters', f'USERNAME={username},PASSWORD={password}',
-            '--region', 'eu-central-1'
-        ]
-        
-        print(f"Authenticating user with Cognito...")
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        # Parse the JSON response to get the access token
-        import json
-        auth_result = json.loads(result.stdout)
-        access_token = auth_result['AuthenticationResult']['AccessToken']
+        with _TOKEN_CACHE_LOCK:
+            # Reuse a cached token until it is about to expire
+            cached = _TOKEN_CACHE.get((client_id, username))
+            if cached and cached[1] - time.time() > TOKEN_REFRESH_WINDOW:
+                print("Reusing cached Bearer token")
+                return cached[0]
+            
+            # Authenticate the user in-process via the cognito-idp client
+            # This uses the USER_PASSWORD_AUTH flow (user-based authentication)
+            print(f"Authenticating user with Cognito...")
+            response = get_aws_client('cognito-idp').initiate_auth(
+                ClientId=client_id,
+                AuthFlow='USER_PASSWORD_AUTH',
+                AuthParameters={
+                    'USERNAME': username,
+                    'PASSWORD': password
+                }
+            )
+            
+            # Extract the access token from the response
+            access_token = response['AuthenticationResult']['AccessToken']
+            
+            try:
+                exp, _ = decode_jwt_claims(access_token)
+                _TOKEN_CACHE[(client_id, username)] = (access_token, exp)
+            except Exception as e:
+                print(f"Could not decode token, not caching it: {e}")
         
         print(f"Successfully obtained Bearer token using user authentication")
         return access_token
             
-    except subprocess.CalledProcessError as e:
+    except ClientError as e:
         print(f"Failed to authenticate user: {e}")
-        print(f"Error output: {e.stderr}")
+        print(f"Error code: {e.response['Error']['Code']}")
         return None
     except Exception as e:
         print(f"Error getting Cognito token: {e}")
         return None
 
 
+def load_persisted_tokens():
+    """Read the persisted token file, returning an empty dict if it is missing or corrupt"""
+    try:
+        with open(TOKEN_CACHE_FILE, 'r') as f:
+            tokens = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(tokens, dict):
+        return {}
+    # Drop entries that don't have the {'token': str, 'exp': number} shape written below
+    return {
+        name: entry for name, entry in tokens.items()
+        if isinstance(entry, dict)
+        and isinstance(entry.get('token'), str)
+        and isinstance(entry.get('exp'), (int, float))
+    }
+
+
+def get_bearer_token(mcp_name):
+    """Get a Bearer token, reusing the one persisted by a previous run while it is still valid"""
+    tokens = load_persisted_tokens()
+    entry = tokens.get(mcp_name)
+    if entry and entry.get('exp', 0) - time.time() > TOKEN_REFRESH_WINDOW:
+        print("Reusing Bearer token persisted by a previous run")
+        return entry['token']
+    
+    bearer_token = get_cognito_bearer_token(mcp_name)
+    if not bearer_token:
+        return None
+    
+    # Write atomically and owner-only, since the file holds bearer tokens
+    tmp_path = f"{TOKEN_CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        exp, _ = decode_jwt_claims(bearer_token)
+        tokens[mcp_name] = {'token': bearer_token, 'exp': exp}
+        os.makedirs(os.path.dirname(TOKEN_CACHE_FILE), mode=0o700, exist_ok=True)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, TOKEN_CACHE_FILE)
+    except Exception as e:
+        print(f"Could not persist Bearer token: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+    
+    return bearer_token
+
+
+@functools.lru_cache(maxsize=32)
+def decode_jwt_claims(bearer_token):
+    """Decode the JWT payload and return its (exp, iat) claims, memoized per token"""
+    # Split the JWT token into parts
+    parts = bearer_token.split('.')
+    if len(parts) != 3:
+        raise ValueError("Invalid JWT format")
+    
+    # Decode the payload (second part)
+    payload = parts[1]
+    # Add padding if necessary
+    padding = len(payload) % 4
+    if padding:
+        payload += '=' * (4 - padding)
+        
+    # Decode base64url (JWT segments use the URL-safe alphabet)
+    decoded_bytes = base64.urlsafe_b64decode(payload)
+    payload_json = json_loads(decoded_bytes)
+    
+    return payload_json.get('exp', 0), payload_json.get('iat', 0)
+
+
 def check_token_expiry(bearer_token):
     """Check if the JWT token is expired using manual base64 decoding"""
     try:
-        # Split the JWT token into parts
-        parts = bearer_token.split('.')
-        if len(parts) != 3:
-            print("Invalid JWT format")
-            return True
-        
-        # Decode the payload (second part)
-        payload = parts[1]
-        # Add padding if necessary
-        padding = len(payload) % 4
-        if padding:
-            payload += '=' * (4 - padding)
-            
-        # Decode base64
-        decoded_bytes = base64.b64decode(payload)
-        payload_json = json.loads(decoded_bytes.decode('utf-8'))
-        
-        exp = payload_json.get('exp', 0)
-        iat = payload_json.get('iat', 0)
+        exp, iat = decode_jwt_claims(bearer_token)
         current_time = datetime.now().timestamp()
         
         print(f"Token Info:")
@@ -135,43 +253,125 @@ def check_token_expiry(bearer_token):
         return True  # Assume valid if can't decode
 
 
+def format_tool_listing(tools):
+    """Render the name, description and parameters of each tool as one block of text"""
+    lines = []
+    for tool in tools:
+        lines.append(tool.name)
+        lines.append(f"   Description: {tool.description}")
+        schema = getattr(tool, 'inputSchema', None) or {}
+        props = schema.get('properties')
+        if props:
+            lines.append(f"   Parameters: {list(props)}")
+        lines.append("")
+    return "".join(f"{line}\n" for line in lines)
+
+
+# Calculator tool calls exercised by the test run: (label, tool name, arguments)
+TOOL_TESTS = [
+    ("add_numbers(5, 3)", "add_numbers", {"a": 5, "b": 3}),
+    ("multiply_numbers(4, 7)", "multiply_numbers", {"a": 4, "b": 7}),
+    ("greet_user('Alice')", "greet_user", {"name": "Alice"}),
+]
+
+
+async def run_tool_tests(session):
+    """Invoke each calculator tool concurrently over the given MCP session"""
+    # The calls are independent, so dispatch them together and report in order
+    results = await asyncio.gather(
+        *(session.call_tool(name=name, arguments=arguments) for _, name, arguments in TOOL_TESTS),
+        return_exceptions=True
+    )
+    
+    for (label, _, _), result in zip(TOOL_TESTS, results):
+        print(f"\nTesting {label}...")
+        if isinstance(result, BaseException):
+            print(f"   Error: {result}")
+        else:
+            print(f"   Result: {result.content[0].text}")
+
+
+def load_agent_endpoint(config_path=AGENTCORE_CONFIG, cache_path=AGENTCORE_CONFIG_CACHE):
+    """Return (agent_arn, mcp_url) of the default agent, cached as JSON until the YAML changes"""
+    config_mtime = os.path.getmtime(config_path)
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached['config_mtime'] == config_mtime:
+            return cached['agent_arn'], cached['mcp_url']
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    import yaml
+    # Prefer the libyaml C loader when PyYAML was built with it
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(config_path, 'r') as f:
+        config = yaml.load(f, Loader=loader)
+    
+    # Get the default agent name
+    default_agent = config.get('default_agent')
+    if not default_agent:
+        raise ValueError("No default agent found in configuration")
+    
+    # Get the agent ARN
+    agent_config = config['agents'][default_agent]
+    agent_arn = agent_config['bedrock_agentcore']['agent_arn']
+    if not agent_arn:
+        raise ValueError("Agent ARN not found. Please deploy the MCP server first:\n   agentcore launch")
+    
+    # URL encode the ARN as specified in AWS docs
+    encoded_arn = quote(agent_arn, safe='')
+    mcp_url = f"https://bedrock-agentcore.eu-central-1.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
+    
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump({'config_mtime': config_mtime, 'agent_arn': agent_arn, 'mcp_url': mcp_url}, f)
+    except OSError as e:
+        print(f"Could not write {cache_path}: {e}")
+    
+    return agent_arn, mcp_url
+
+
 async def main():
     """Main function for MCP tool invocation testing"""
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description='Test deployed MCP server with authentication')
     parser.add_argument('--name', required=True, 
                        help='MCP server name (required)')
+    parser.add_argument('--repeat', type=int, default=1,
+                       help='Number of times to run the tool tests over the same session')
     args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
     
     mcp_name = args.name
+    repeat = args.repeat
     
-    # Load agent ARN from .bedrock_agentcore.yaml
-    try:
-        with open(".bedrock_agentcore.yaml", 'r') as f:
-            config = yaml.safe_load(f)
-    except FileNotFoundError:
+    # Load agent ARN and MCP URL from .bedrock_agentcore.yaml while fetching the
+    # bearer token from the on-disk cache or Cognito using stored SSM parameters.
+    # Both are blocking, so run them side by side in worker threads.
+    bearer_token, endpoint = await asyncio.gather(
+        asyncio.to_thread(get_bearer_token, mcp_name),
+        asyncio.to_thread(load_agent_endpoint),
+        return_exceptions=True
+    )
+    
+    if isinstance(endpoint, FileNotFoundError):
         print("No .bedrock_agentcore.yaml found. Please deploy the MCP server first:")
         print("   agentcore configure -e blogpost_mcp_server.py --protocol MCP -n mcp_simple_calculator")
         print("   agentcore launch")
         sys.exit(1)
-    
-    # Get the default agent name
-    default_agent = config.get('default_agent')
-    if not default_agent:
-        print("No default agent found in configuration")
+    if isinstance(endpoint, ValueError):
+        print(endpoint)
         sys.exit(1)
-    
-    # Get the agent ARN
-    agent_config = config['agents'][default_agent]
-    agent_arn = agent_config['bedrock_agentcore']['agent_arn']
-    
-    if not agent_arn:
-        print("Agent ARN not found. Please deploy the MCP server first:")
-        print("   agentcore launch")
-        sys.exit(1)
-    
-    # Get bearer token from Cognito using stored SSM parameters
-    bearer_token = get_cognito_bearer_token(mcp_name)
+    if isinstance(endpoint, BaseException):
+        raise endpoint
+    if isinstance(bearer_token, BaseException):
+        raise bearer_token
+    agent_arn, mcp_url = endpoint
     
     if not bearer_token:
         print("Error: Failed to get Bearer token from Cognito")
@@ -187,23 +387,17 @@ async def main():
     # Check token expiry
     if not check_token_expiry(bearer_token):
         print("\nToken is expired. Getting a fresh token...")
-        bearer_token = get_cognito_bearer_token(mcp_name)
+        bearer_token = await asyncio.to_thread(get_bearer_token, mcp_name)
         if not bearer_token:
             print("Failed to refresh token. Check your Cognito setup.")
             sys.exit(1)
     
-    # URL encode the ARN as specified in AWS docs
-    encoded_arn = agent_arn.replace(':', '%3A').replace('/', '%2F')
-    mcp_url = f"https://bedrock-agentcore.eu-central-1.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
-    
-    # Enhanced headers with additional AWS requirements
+    # MCP streamable-HTTP needs only the bearer token and content negotiation headers
     headers = {
         "authorization": f"Bearer {bearer_token}",
         "Content-Type": "application/json",
         "Accept": "application/json",
-        "User-Agent": "MCP-Tool-Client/1.0",
-        "X-Amz-Target": "BedrockAgentRuntime.InvokeAgent",
-        "X-Amz-Content-Sha256": "UNSIGNED-PAYLOAD"
+        "User-Agent": "MCP-Tool-Client/1.0"
     }
     
     print(f"Connecting to: {mcp_url}")
@@ -213,8 +407,8 @@ async def main():
         async with streamablehttp_client(
             mcp_url, 
             headers, 
-            timeout=timedelta(seconds=120), 
-            terminate_on_close=False
+            terminate_on_close=False,
+            httpx_client_factory=create_http_client
         ) as (read_stream, write_stream, _):
             print("HTTP connection established")
             
@@ -230,14 +424,7 @@ async def main():
                 
                 print("\nAvailable MCP Tools:")
                 print("=" * 50)
-                for tool in tool_result.tools:
-                    print(f"{tool.name}")
-                    print(f"   Description: {tool.description}")
-                    if hasattr(tool, 'inputSchema') and tool.inputSchema:
-                        properties = tool.inputSchema.get('properties', {})
-                        if properties:
-                            print(f"   Parameters: {list(properties.keys())}")
-                    print()
+                sys.stdout.write(format_tool_listing(tool_result.tools))
                 
                 print(f"Successfully connected to MCP server!")
                 print(f"Found {len(tool_result.tools)} tools available.")
@@ -245,38 +432,10 @@ async def main():
                 print("\nTesting MCP Tools:")
                 print("=" * 50)
                 
-                # Test add_numbers tool
-                try:
-                    print("\nTesting add_numbers(5, 3)...")
-                    add_result = await session.call_tool(
-                        name="add_numbers",
-                        arguments={"a": 5, "b": 3}
-                    )
-                    print(f"   Result: {add_result.content[0].text}")
-                except Exception as e:
-                    print(f"   Error: {e}")
-                
-                # Test multiply_numbers tool
-                try:
-                    print("\nTesting multiply_numbers(4, 7)...")
-                    multiply_result = await session.call_tool(
-                        name="multiply_numbers",
-                        arguments={"a": 4, "b": 7}
-                    )
-                    print(f"   Result: {multiply_result.content[0].text}")
-                except Exception as e:
-                    print(f"   Error: {e}")
-                
-                # Test greet_user tool
-                try:
-                    print("\nTesting greet_user('Alice')...")
-                    greet_result = await session.call_tool(
-                        name="greet_user",
-                        arguments={"name": "Alice"}
-                    )
-                    print(f"   Result: {greet_result.content[0].text}")
-                except Exception as e:
-                    print(f"   Error: {e}")
+                for i in range(repeat):
+                    if repeat > 1:
+                        print(f"\nRun {i + 1}/{repeat}")
+                    await run_tool_tests(session)
                 
                 print("\nMCP tool testing completed!")
                 print("=" * 50)
@@ -6,34 +6,69 @@ This module provides a local testing client for the MCP server.
 It connects to a locally running MCP server and lists available tools.
 
 Usage:
-    python blogpost_mcp_client.py
+    python blogpost_mcp_client.py [--repeat N]
 
 Prerequisites:
     - MCP server must be running locally on localhost:8000
     - Run 'python blogpost_mcp_server.py' in another terminal first
 """
 
+import argparse
 import asyncio
+import contextlib
 from datetime import timedelta
 
 from mcp import ClientSession
 from mcp.client.streamable_http import streamablehttp_client
 
-async def main():
-    mcp_url = "http://localhost:8000/mcp"
-    headers = {}
-
-    async with streamablehttp_client(mcp_url, headers, timeout=timedelta(seconds=120), terminate_on_close=False) as (
-        read_stream,
-        write_stream,
-        _,
-    ):
-        async with ClientSession(read_stream, write_stream) as session:
+MCP_URL = "http://localhost:8000/mcp"
+
+# Shared MCP session, opened on first use and reused by later calls
+_session = None
+_session_stack = None
+
+async def get_session():
+    """Return the shared MCP session, connecting and initializing it on first use"""
+    global _session, _session_stack
+    if _session is None:
+        stack = contextlib.AsyncExitStack()
+        try:
+            read_stream, write_stream, _ = await stack.enter_async_context(
+                streamablehttp_client(MCP_URL, {}, timeout=timedelta(seconds=120), terminate_on_close=False)
+            )
+            session = await stack.enter_async_context(ClientSession(read_stream, write_stream))
             await session.initialize()
+        except BaseException:
+            # Close whatever was already entered; the stack is not stored, so close_session() can't
+            await stack.aclose()
+            raise
+        _session, _session_stack = session, stack
+    return _session
+
+async def close_session():
+    """Close the shared MCP session if one is open"""
+    global _session, _session_stack
+    if _session_stack is not None:
+        await _session_stack.aclose()
+    _session, _session_stack = None, None
+
+async def main():
+    parser = argparse.ArgumentParser(description='List tools of the local MCP server')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of times to list tools over the same session')
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    try:
+        for _ in range(args.repeat):
+            session = await get_session()
             tool_result = await session.list_tools()
             print("Available tools:")
             for tool in tool_result.tools:
                 print(f"  - {tool.name}: {tool.description}")
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -13,13 +13,22 @@ Prerequisites:
 
 from strands import Agent
 import os
+import asyncio
+import json
+import time
+import base64
+import functools
+import threading
 import boto3
+import httpx
+from botocore.config import Config
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 from strands.models import BedrockModel
 from strands.tools.mcp import MCPClient
 from mcp.client.streamable_http import streamablehttp_client
 from datetime import timedelta
-from typing import List, Optional
+from urllib.parse import quote
+from typing import Dict, List, Optional
 import traceback
 import logging
 
@@ -27,43 +36,98 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# MCP server endpoint - UPDATE THE ARN WITH YOUR ACTUAL ARN FROM .bedrock_agentcore.yaml
+# Find the ARN in your .bedrock_agentcore.yaml file after running 'agentcore launch'
+MCP_SERVER_ARN = "arn:aws:bedrock-agentcore:eu-central-1:ACCOUNTID:runtime/blogpost_mcp_simple_calculator-DEPLOYMENTID"
+REGION = "eu-central-1"
+ENCODED_ARN = quote(MCP_SERVER_ARN, safe="")
+MCP_URL = f"https://bedrock-agentcore.{REGION}.amazonaws.com/runtimes/{ENCODED_ARN}/invocations?qualifier=DEFAULT"
+
+# AWS clients are created once and shared across calls; adaptive retries absorb throttling
+AWS_CONFIG = Config(retries={'mode': 'adaptive', 'max_attempts': 10}, max_pool_connections=32)
+_SSM = boto3.client('ssm', config=AWS_CONFIG)
+_COGNITO = boto3.client('cognito-idp', region_name=REGION, config=AWS_CONFIG)
+
+# In-memory cache of SSM values by (name, decrypt), re-fetched after the TTL so rotations propagate
+SSM_CACHE_TTL = 15 * 60  # seconds
+_SSM_CACHE = {}
+_SSM_CACHE_LOCK = threading.Lock()
+
+# In-memory cache of bearer tokens by mcp_name, reused until shortly before they expire
+TOKEN_REFRESH_WINDOW = 60  # seconds
+TOKEN_FALLBACK_LIFETIME = 55 * 60  # seconds, assumed when the token's exp claim is unreadable
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=32)
+def decode_jwt_claims(token: str) -> tuple:
+    """
+    Decode the JWT payload and return its (exp, iat) claims, memoized per token.
+    """
+    parts = token.split('.')
+    if len(parts) != 3:
+        raise ValueError("Invalid JWT format")
+    payload = parts[1] + '=' * (-len(parts[1]) % 4)
+    payload_json = json.loads(base64.urlsafe_b64decode(payload))
+    return payload_json.get('exp', 0), payload_json.get('iat', 0)
+
+
+def _cached_bearer_token(mcp_name: str) -> Optional[str]:
+    """
+    Return the cached token if it is valid beyond TOKEN_REFRESH_WINDOW, else None.
+    Callers must hold _TOKEN_CACHE_LOCK.
+    """
+    cached = _TOKEN_CACHE.get(mcp_name)
+    if cached and time.time() < cached[1] - TOKEN_REFRESH_WINDOW:
+        return cached[0]
+    return None
 
 def get_cognito_bearer_token(mcp_name: str) -> str:
     """
     Get Bearer token from Cognito using user credentials stored in SSM.
     This uses USER_PASSWORD_AUTH flow for user-based authentication.
+    The token is cached and reused until TOKEN_REFRESH_WINDOW seconds before it expires.
+    """
+    with _TOKEN_CACHE_LOCK:
+        cached = _cached_bearer_token(mcp_name)
+        if cached:
+            logger.debug("Reusing cached Bearer token")
+            return cached
+        
+        access_token = _authenticate_with_cognito(mcp_name)
+        try:
+            exp, _ = decode_jwt_claims(access_token)
+        except Exception as e:
+            logger.warning("Could not decode token expiry, assuming default lifetime: %s", e)
+            exp = time.time() + TOKEN_FALLBACK_LIFETIME
+        _TOKEN_CACHE[mcp_name] = (access_token, exp)
+        return access_token
+
+def _authenticate_with_cognito(mcp_name: str) -> str:
+    """
+    Authenticate against Cognito with the USER_PASSWORD_AUTH flow and return a new access token.
     """
     try:
         logger.info("Getting Bearer token from Cognito using user credentials...")
         
-        # Get stored parameters from SSM
-        ssm_client = boto3.client('ssm')
-        
-        # Get Client ID (user pool client, not machine client)
-        client_id = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/machine_client_id'
-        )['Parameter']['Value']
-        
-        # Get username and password
-        username = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/username'
-        )['Parameter']['Value']
-        
-        password = ssm_client.get_parameter(
-            Name=f'/app/blogpost/mcp/{mcp_name}/password',
-            WithDecryption=True
-        )['Parameter']['Value']
+        # Get Client ID (user pool client, not machine client), username and password in one call
+        client_id_name = f'/app/blogpost/mcp/{mcp_name}/machine_client_id'
+        username_name = f'/app/blogpost/mcp/{mcp_name}/username'
+        password_name = f'/app/blogpost/mcp/{mcp_name}/password'
+        params = get_ssm_parameters([client_id_name, username_name, password_name])
         
-        logger.info(f"Retrieved user credentials from SSM")
-        logger.info(f"Using username: {username}")
+        client_id = params[client_id_name]
+        username = params[username_name]
+        password = params[password_name]
         
-        # Use boto3 cognito-idp client directly (no subprocess needed)
-        cognito_client = boto3.client('cognito-idp', region_name='eu-central-1')
+        logger.info("Retrieved user credentials from SSM")
+        logger.info("Using username: %s", username)
         
-        logger.info(f"Authenticating user with Cognito...")
+        logger.info("Authenticating user with Cognito...")
         
         # Use initiate_auth with USER_PASSWORD_AUTH flow
-        response = cognito_client.initiate_auth(
+        response = _COGNITO.initiate_auth(
             ClientId=client_id,
             AuthFlow='USER_PASSWORD_AUTH',
             AuthParameters={
@@ -75,11 +139,11 @@ def get_cognito_bearer_token(mcp_name: str) -> str:
         # Extract the access token from the response
         access_token = response['AuthenticationResult']['AccessToken']
         
-        logger.info(f"Successfully obtained Bearer token using user authentication")
+        logger.info("Successfully obtained Bearer token using user authentication")
         return access_token
             
     except Exception as e:
-        logger.error(f"Error getting Cognito token: {e}")
+        logger.error("Error getting Cognito token: %s", e)
         raise Exception(f"Error getting Cognito token: {e}")
 
 def get_ssm_parameter(parameter_name: str, decrypt: bool = True) -> str:
@@ -87,17 +151,60 @@ def get_ssm_parameter(parameter_name: str, decrypt: bool = True) -> str:
     Retrieve a parameter from AWS Systems Manager Parameter Store.
     This follows the Single Responsibility Principle by handling only parameter retrieval.
     """
+    return get_ssm_parameters([parameter_name], decrypt)[parameter_name]
+
+def get_ssm_parameters(parameter_names: List[str], decrypt: bool = True) -> Dict[str, str]:
+    """
+    Retrieve several parameters from AWS Systems Manager Parameter Store in one GetParameters call.
+    Cached values are reused; only missing or stale names are requested.
+    """
     try:
-        ssm_client = boto3.client('ssm')
-        response = ssm_client.get_parameter(
-            Name=parameter_name,
-            WithDecryption=decrypt
-        )
-        logger.info(f"SSM parameter {parameter_name} retrieved successfully")
-        return response['Parameter']['Value']
+        with _SSM_CACHE_LOCK:
+            now = time.monotonic()
+            missing = [
+                name for name in parameter_names
+                if (name, decrypt) not in _SSM_CACHE or now - _SSM_CACHE[(name, decrypt)][0] >= SSM_CACHE_TTL
+            ]
+            if missing:
+                response = _SSM.get_parameters(
+                    Names=missing,
+                    WithDecryption=decrypt
+                )
+                if response['InvalidParameters']:
+                    raise ValueError(f"Parameters not found: {response['InvalidParameters']}")
+                for p in response['Parameters']:
+                    _SSM_CACHE[(p['Name'], decrypt)] = (now, p['Value'])
+                logger.info("SSM parameters %s retrieved successfully", missing)
+            return {name: _SSM_CACHE[(name, decrypt)][1] for name in parameter_names}
     except Exception as e:
-        logger.error(f"Failed to retrieve SSM parameter {parameter_name}: {str(e)}")
-        raise ValueError(f"Failed to retrieve SSM parameter {parameter_name}: {str(e)}")
+        logger.error("Failed to retrieve SSM parameters %s: %s", parameter_names, e)
+        raise ValueError(f"Failed to retrieve SSM parameters {parameter_names}: {str(e)}")
+
+class CognitoBearerAuth(httpx.Auth):
+    """
+    httpx auth hook that stamps a current Cognito bearer token onto every MCP request.
+    Tokens come from the expiry-aware cache, so the long-lived MCP session never sends an expired one.
+    """
+    def __init__(self, mcp_name: str):
+        self.mcp_name = mcp_name
+
+    def auth_flow(self, request):
+        request.headers["authorization"] = f"Bearer {get_cognito_bearer_token(self.mcp_name)}"
+        yield request
+
+    async def async_auth_flow(self, request):
+        # Serve a valid cached token inline; don't wait on the lock, as its holder may be re-authenticating
+        token = None
+        if _TOKEN_CACHE_LOCK.acquire(blocking=False):
+            try:
+                token = _cached_bearer_token(self.mcp_name)
+            finally:
+                _TOKEN_CACHE_LOCK.release()
+        if token is None:
+            # Re-authenticating calls boto3, so keep it off the transport's event loop
+            token = await asyncio.to_thread(get_cognito_bearer_token, self.mcp_name)
+        request.headers["authorization"] = f"Bearer {token}"
+        yield request
 
 app = BedrockAgentCoreApp()
 agent = None
@@ -113,29 +220,23 @@ def create_agent() -> Agent:
         # MCP server configuration
         mcp_name = "blogpost_mcp_simple_calculator"
         
-        # Get MCP server URL - UPDATE THIS WITH YOUR ACTUAL ARN FROM .bedrock_agentcore.yaml
-        # Find the ARN in your .bedrock_agentcore.yaml file after running 'agentcore launch'
-        mcp_server_arn = "arn:aws:bedrock-agentcore:eu-central-1:ACCOUNTID:runtime/blogpost_mcp_simple_calculator-DEPLOYMENTID"
-        region = "eu-central-1"
-        encoded_arn = mcp_server_arn.replace(":", "%3A").replace("/", "%2F")
-        mcp_url = f"https://bedrock-agentcore.{region}.amazonaws.com/runtimes/{encoded_arn}/invocations?qualifier=DEFAULT"
+        logger.info("MCP Server URL: %s", MCP_URL)
+        logger.info("MCP Name: %s", mcp_name)
         
-        logger.info(f"MCP Server URL: {mcp_url}")
-        logger.info(f"MCP Name: {mcp_name}")
-        
-        # Get bearer token using user-based authentication
-        bearer_token = get_cognito_bearer_token(mcp_name)
+        # Get bearer token using user-based authentication (fails fast on bad credentials)
+        get_cognito_bearer_token(mcp_name)
         
         # Create the MCP client following the working example pattern
-        mcp_client = MCPClient(lambda: streamablehttp_client(mcp_url, {
-            "authorization": f"Bearer {bearer_token}",
+        # The auth hook re-reads the token cache per request, so tokens are renewed before they expire
+        mcp_auth = CognitoBearerAuth(mcp_name)
+        mcp_client = MCPClient(lambda: streamablehttp_client(MCP_URL, {
             "Content-Type": "application/json"
-        }))
+        }, auth=mcp_auth))
         
         # Initialize the model
         model_id = "eu.anthropic.claude-3-7-sonnet-20250219-v1:0"
         model = BedrockModel(model_id=model_id)
-        logger.info(f"Using model: {model_id}")
+        logger.info("Using model: %s", model_id)
         
         logger.info("Connecting to MCP server to retrieve tools...")
         
@@ -145,12 +246,17 @@ def create_agent() -> Agent:
         
         # Get tools without context manager (client stays alive)
         all_tools = mcp_client.list_tools_sync()
-        logger.info(f"Retrieved {len(all_tools)} tools from MCP server")
+        logger.info("Retrieved %s tools from MCP server", len(all_tools))
         
-        for tool in all_tools:
-            # Get tool description from tool_spec dictionary
-            tool_desc = tool.tool_spec.get('description', 'No description available')
-            logger.info(f"   - {tool.tool_name}: {tool_desc}")
+        # Render each tool's line once; it is both logged and listed in the system prompt
+        tool_lines = [
+            f"- {tool.tool_name}: {tool.tool_spec.get('description', 'No description available')}"
+            for tool in all_tools
+        ]
+        if logger.isEnabledFor(logging.INFO):
+            for line in tool_lines:
+                logger.info("   %s", line)
+        tool_prompt_lines = "\n".join(tool_lines)
         
         # Create agent with tools (MCP client remains active)
         agent = Agent(
@@ -159,7 +265,7 @@ def create_agent() -> Agent:
             system_prompt=f"""You are an intelligent assistant with direct access to MCP (Model Context Protocol) tools.
 
 You have access to the following MCP tools:
-{chr(10).join([f"- {tool.tool_name}: {tool.tool_spec.get('description', 'No description available')}" for tool in all_tools])}
+{tool_prompt_lines}
 
 Use these tools when appropriate to help users. Always be helpful and accurate in your responses."""
         )
@@ -168,10 +274,17 @@ Use these tools when appropriate to help users. Always be helpful and accurate i
         return agent
             
     except Exception as e:
-        logger.error(f"Failed to create agent: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Failed to create agent: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         raise
 
+# Create the agent when the container starts so the first request doesn't pay for it.
+# If bootstrap fails the import still succeeds and the first request retries it.
+try:
+    agent = create_agent()
+except Exception as e:
+    logger.error("Agent initialization deferred to the first request: %s", e)
+
 @app.entrypoint
 async def single_agent_mcp_bedrock(payload):
     """
@@ -186,38 +299,37 @@ async def single_agent_mcp_bedrock(payload):
         if not user_input:
             return "Error: No input provided in payload"
             
-        logger.info(f"User input: {user_input}")
+        logger.info("User input: %s", user_input)
         
-        # Create agent only once (persistent session)
+        # The agent is normally created at import; retry here only if that failed
         if agent is None:
             logger.info("Initializing agent with persistent MCP session...")
             try:
-                agent = create_agent()
+                # Build the agent in a worker thread so the blocking SSM/Cognito/MCP calls don't stall the event loop
+                agent = await asyncio.to_thread(create_agent)
                 logger.info("Agent initialization completed")
             except Exception as e:
                 error_msg = f"Failed to create agent: {str(e)}"
                 logger.error(error_msg)
                 return error_msg
-        else:
-            logger.info("Using existing agent with persistent MCP session")
 
         # Run the agent (MCP client already started and persistent)
         logger.info("Running agent...")
         try:
             response = agent(user_input)
             result = response.message['content'][0]['text']
-            logger.info(f"Agent response: {result}")
+            logger.info("Agent response: %s", result)
             return result
         except Exception as e:
             error_msg = f"Agent execution failed: {str(e)}"
             logger.error(error_msg)
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Traceback: %s", traceback.format_exc())
             return error_msg
             
     except Exception as e:
         error_msg = f"Entrypoint failed: {str(e)}"
         logger.error(error_msg)
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Traceback: %s", traceback.format_exc())
         return error_msg
 
 if __name__ == "__main__":